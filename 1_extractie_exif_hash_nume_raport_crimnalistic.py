@@ -3,11 +3,36 @@ import subprocess
 import csv
 import hashlib
 import json
+import sqlite3
 from datetime import datetime
 import platform
 import logging
+import logging.handlers
+import queue
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Read size used when hashing files; large reads let hashlib release the GIL
+HASH_CHUNK_SIZE = 1 << 20
+
+# Seconds to wait for ExifTool to answer a command before replacing the session
+EXIFTOOL_TIMEOUT = 120
+
+# Separator line framing each record in the TXT report
+TXT_SEPARATOR = "=" * 50 + "\n"
+
+# Written in CSV and TXT outputs in place of a hash skipped for a unique-size file,
+# which JSON and SQLite record as null; a failed calculation stays an empty string
+SKIPPED_HASH_MARKER = 'skipped'
+
 def setup_logging(log_file='forensic_metadata.log', log_level=logging.INFO):
     """
     Configure logging for the script.
@@ -20,45 +45,346 @@ def setup_logging(log_file='forensic_metadata.log', log_level=logging.INFO):
     if log_dir:  # If log_dir is not empty
         os.makedirs(log_dir, exist_ok=True)
     
+    # Buffer file records in memory and write them in batches; errors are flushed immediately
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    buffered_file_handler = logging.handlers.MemoryHandler(
+        capacity=1000,
+        flushLevel=logging.ERROR,
+        target=file_handler
+    )
+    
     # Configure logging
     logging.basicConfig(
         level=log_level,
         format='%(asctime)s - %(levelname)s: %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S',
         handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
+            buffered_file_handler,
             logging.StreamHandler()  # Also log to console
         ]
     )
+    # basicConfig only sets the formatter on the handlers it is given
+    file_handler.setFormatter(buffered_file_handler.formatter)
     logging.info("Logging initialized")
 
-def calculate_file_hashes(filepath):
+def verify_crypto_acceleration():
+    """
+    Log the hashing backend in use and warn if SHA-256 hardware acceleration is unavailable.
+    
+    hashlib only reaches the CPU's SHA extensions (SHA-NI) through OpenSSL, so an
+    interpreter without OpenSSL, or an OpenSSL built with no-asm, hashes much slower.
+    
+    :return: True if OpenSSL is in use and the CPU reports SHA extensions
+    """
+    try:
+        import ssl
+        logging.info(f"OpenSSL version: {ssl.OPENSSL_VERSION}")
+    except ImportError:
+        logging.warning("Python was built without the ssl module")
+    logging.info(f"Available hash algorithms: {', '.join(sorted(hashlib.algorithms_available))}")
+    
+    uses_openssl = type(hashlib.sha256()).__module__ == '_hashlib'
+    if not uses_openssl:
+        logging.warning("hashlib is not using OpenSSL; SHA-256 will run without hardware acceleration")
+    
+    # CPU flags are only exposed through /proc/cpuinfo on Linux
+    try:
+        with open('/proc/cpuinfo', encoding='utf-8') as cpuinfo:
+            cpu_flags = set(cpuinfo.read().split())
+    except OSError:
+        logging.info("Could not read /proc/cpuinfo; skipping SHA-NI detection")
+        return uses_openssl
+    
+    # x86 reports 'sha_ni', ARM reports 'sha2'
+    has_sha_extensions = bool(cpu_flags & {'sha_ni', 'sha2'})
+    if has_sha_extensions:
+        logging.info("CPU supports SHA hardware acceleration")
+    else:
+        logging.warning("CPU does not report SHA hardware acceleration (sha_ni/sha2)")
+    
+    return uses_openssl and has_sha_extensions
+
+def dumps_json(data, indent=True):
     """
-    Calculate file hashes (MD5, SHA1, SHA256).
+    Serialize data to a JSON string, using orjson when it is installed.
+    
+    :param data: Data to serialize
+    :param indent: Pretty-print with 2-space indentation; otherwise emit a single line
+    :return: JSON string
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else None).decode('utf-8')
+        except TypeError:
+            # orjson rejects some values (e.g. integers wider than 64 bits)
+            pass
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False)
+
+def calculate_file_hashes(filepath, algorithms=('sha256',), hash_cache=None, file_stat=None):
+    """
+    Calculate file hashes (SHA256 by default).
     
     :param filepath: Path to the file
-    :return: Dictionary with file hashes
+    :param algorithms: hashlib algorithm names to calculate, e.g. ('md5', 'sha1', 'sha256')
+    :param hash_cache: Optional hash cache returned by load_hash_cache
+    :param file_stat: Optional os.stat_result of the file, saving a stat call for the cache lookup
+    :return: Dictionary with file hashes, keyed as '<ALGORITHM>_Hash'
     """
-    hash_algorithms = {
-        'MD5': hashlib.md5(),
-        'SHA1': hashlib.sha1(),
-        'SHA256': hashlib.sha256()
-    }
+    hash_keys = [f"{name.upper()}_Hash" for name in algorithms]
+    
+    # Reuse hashes from a previous run if the file is unchanged
+    if hash_cache is not None:
+        try:
+            stat = file_stat or os.stat(filepath)
+        except OSError as e:
+            logging.error(f"Error calculating hashes for {filepath}: {e}")
+            return {}
+        cache_key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        hash_cache['scanned'][cache_key[0]] = cache_key
+        cached_hashes = hash_cache['entries'].get(cache_key, {})
+        if all(key in cached_hashes for key in hash_keys):
+            hash_cache['hits'][cache_key[0]] = True
+            return {key: cached_hashes[key] for key in hash_keys}
+    
+    hash_objects = [hashlib.new(name) for name in algorithms]
+    hash_updates = [hash_obj.update for hash_obj in hash_objects]
+    
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
     
     try:
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                for hash_obj in hash_algorithms.values():
-                    hash_obj.update(chunk)
+        # Single pass over the file, feeding the same buffer to every digest
+        with open(filepath, 'rb', buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                chunk = view[:size]
+                for hash_update in hash_updates:
+                    hash_update(chunk)
         
-        return {
-            f"{alg}_Hash": hash_obj.hexdigest() 
-            for alg, hash_obj in hash_algorithms.items()
+        file_hashes = {
+            key: hash_obj.hexdigest()
+            for key, hash_obj in zip(hash_keys, hash_objects)
         }
+        if hash_cache is not None:
+            hash_cache['entries'][cache_key] = hash_cache['updated'][cache_key] = {**cached_hashes, **file_hashes}
+        return file_hashes
     except IOError as e:
         logging.error(f"Error calculating hashes for {filepath}: {e}")
         return {}
 
+def load_hash_cache(db_path):
+    """
+    Load previously calculated hashes from the SQLite hash cache.
+    
+    Entries are keyed by (absolute path, size, mtime_ns), so a file that has not
+    changed since the last run does not need to be read again.
+    
+    :param db_path: Path to the SQLite database holding the hash_cache table
+    :return: Dictionary with the loaded 'entries', plus the 'updated' entries, the
+             'scanned' keys and the cache 'hits' of this run
+    """
+    hash_cache = {'db_path': db_path, 'entries': {}, 'updated': {}, 'scanned': {}, 'hits': {}}
+    if not os.path.exists(db_path):
+        return hash_cache
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.execute('''
+                SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'hash_cache'
+            ''')
+            if cursor.fetchone():
+                for path, size, mtime_ns, md5, sha1, sha256 in conn.execute(
+                    'SELECT path, size, mtime_ns, md5, sha1, sha256 FROM hash_cache'
+                ):
+                    hash_cache['entries'][(path, size, mtime_ns)] = {
+                        f"{alg}_Hash": value
+                        for alg, value in (('MD5', md5), ('SHA1', sha1), ('SHA256', sha256))
+                        if value
+                    }
+        finally:
+            conn.close()
+        logging.info(f"Loaded {len(hash_cache['entries'])} cached hashes from {db_path}")
+    except sqlite3.Error as e:
+        logging.warning(f"Could not load hash cache from {db_path}: {e}")
+    return hash_cache
+
+def save_hash_cache(hash_cache):
+    """
+    Persist the hashes calculated during this run to the SQLite hash cache.
+    
+    Rows for files looked up this run whose size or modification time has
+    changed since are deleted, so the table does not grow with stale entries.
+    
+    :param hash_cache: Hash cache returned by load_hash_cache
+    """
+    if hash_cache['hits']:
+        logging.info(f"Reused cached hashes for {len(hash_cache['hits'])} unchanged files (not recalculated)")
+    
+    stale_keys = [
+        key for key in hash_cache['entries']
+        if key[0] in hash_cache['scanned'] and key != hash_cache['scanned'][key[0]]
+    ]
+    if not hash_cache['updated'] and not stale_keys:
+        return
+    
+    try:
+        conn = sqlite3.connect(hash_cache['db_path'])
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS hash_cache (
+                        path TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        md5 TEXT,
+                        sha1 TEXT,
+                        sha256 TEXT,
+                        PRIMARY KEY (path, size, mtime_ns)
+                    )
+                ''')
+                conn.executemany('''
+                    INSERT OR REPLACE INTO hash_cache (path, size, mtime_ns, md5, sha1, sha256)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (path, size, mtime_ns,
+                     hashes.get('MD5_Hash'), hashes.get('SHA1_Hash'), hashes.get('SHA256_Hash'))
+                    for (path, size, mtime_ns), hashes in hash_cache['updated'].items()
+                ])
+                conn.executemany('''
+                    DELETE FROM hash_cache WHERE path = ? AND size = ? AND mtime_ns = ?
+                ''', stale_keys)
+        finally:
+            conn.close()
+        logging.info(
+            f"Saved {len(hash_cache['updated'])} hashes to cache {hash_cache['db_path']}, "
+            f"removed {len(stale_keys)} stale entries"
+        )
+    except sqlite3.Error as e:
+        logging.warning(f"Could not save hash cache to {hash_cache['db_path']}: {e}")
+
+def start_exiftool_session(exiftool_path):
+    """
+    Start a persistent ExifTool process in -stay_open mode.
+    
+    Reusing one process for all files avoids paying the Perl startup
+    cost for every file. Its stdout and stderr are read by background
+    threads, so a command that hangs can be given up on after a timeout.
+    
+    :param exiftool_path: Path to ExifTool executable
+    :return: Dictionary with the running ExifTool 'process' and the queues
+             receiving its 'stdout' and 'stderr' lines
+    """
+    process = subprocess.Popen(
+        [exiftool_path, '-stay_open', 'True', '-@', '-',
+         '-common_args', '-charset', 'filename=utf8'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding='utf-8',
+        bufsize=1
+    )
+    session = {'process': process, 'stdout': queue.Queue(), 'stderr': queue.Queue()}
+    for stream in ('stdout', 'stderr'):
+        threading.Thread(
+            target=read_pipe_lines,
+            args=(getattr(process, stream), session[stream]),
+            daemon=True
+        ).start()
+    return session
+
+def read_pipe_lines(pipe, lines):
+    """
+    Forward every line read from a pipe to a queue, followed by '' at end of file.
+    
+    :param pipe: Text pipe of the ExifTool process
+    :param lines: Queue receiving the lines
+    """
+    try:
+        for line in pipe:
+            lines.put(line)
+    except (OSError, ValueError):
+        pass
+    lines.put('')
+
+def run_exiftool_command(session, args):
+    """
+    Run a single command in a persistent ExifTool session.
+    
+    :param session: ExifTool session returned by start_exiftool_session
+    :param args: List of ExifTool arguments for this command
+    :return: Tuple of the command's output and its error messages
+    """
+    # -echo4 marks the end of this command's messages on stderr,
+    # the same way {ready} marks the end of its output on stdout
+    session['process'].stdin.write('\n'.join(args) + '\n-echo4\n{ready}\n-execute\n')
+    session['process'].stdin.flush()
+    
+    streams = []
+    for stream in ('stdout', 'stderr'):
+        lines = []
+        while True:
+            try:
+                line = session[stream].get(timeout=EXIFTOOL_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(f"ExifTool did not respond within {EXIFTOOL_TIMEOUT} seconds")
+            if not line:
+                raise RuntimeError("ExifTool session terminated unexpectedly")
+            if line.rstrip() == '{ready}':
+                break
+            lines.append(line)
+        streams.append(''.join(lines))
+    return streams[0], streams[1].strip()
+
+def query_exiftool(exiftool_sessions, exiftool_path, args):
+    """
+    Run a command on an idle session from the pool.
+    
+    A session that died or did not respond within EXIFTOOL_TIMEOUT is killed and
+    its slot in the pool is left empty (None); the next command using that slot
+    starts a new session, so a single failure does not break every later file.
+    
+    :param exiftool_sessions: Queue of idle ExifTool sessions (None marks an empty slot)
+    :param exiftool_path: Path to ExifTool executable
+    :param args: List of ExifTool arguments for this command
+    :return: Tuple of the command's output and its error messages
+    """
+    session = exiftool_sessions.get()
+    try:
+        if session is None:
+            session = start_exiftool_session(exiftool_path)
+        return run_exiftool_command(session, args)
+    except (RuntimeError, OSError):
+        if session is not None:
+            session['process'].kill()
+            session['process'].wait()
+            session = None
+        raise
+    finally:
+        exiftool_sessions.put(session)
+
+def close_exiftool_session(session):
+    """
+    Ask a persistent ExifTool session to exit and wait for it.
+    
+    :param session: ExifTool session returned by start_exiftool_session, or None
+    """
+    if session is None:
+        return
+    process = session['process']
+    try:
+        process.stdin.write('-stay_open\nFalse\n')
+        process.stdin.flush()
+        process.stdin.close()
+        process.wait(timeout=10)
+    except Exception as e:
+        logging.warning(f"ExifTool session did not exit cleanly: {e}")
+        process.kill()
+
 def prepare_output_folder(output_path):
     """
     Prepare and return the output folder path.
@@ -74,6 +400,133 @@ def prepare_output_folder(output_path):
         logging.error(f"Error creating output folder {output_path}: {e}")
         raise
 
+def process_file(filepath, file_stat, compute_hashes, hash_algorithms, hash_cache, exiftool_sessions, exiftool_path, device_source, extraction_timestamp):
+    """
+    Calculate hashes and extract metadata for a single file.
+    
+    :param filepath: Path to the file
+    :param file_stat: os.stat_result of the file
+    :param compute_hashes: Whether to calculate the file hashes
+    :param hash_algorithms: hashlib algorithm names to calculate
+    :param hash_cache: Hash cache returned by load_hash_cache, or None
+    :param exiftool_sessions: Queue of idle ExifTool sessions
+    :param exiftool_path: Path to ExifTool executable, used to replace a failed session
+    :param device_source: Source/device recorded in the entry
+    :param extraction_timestamp: ISO timestamp of the extraction run
+    :return: Consolidated metadata entry
+    """
+    # Calculate file hashes
+    file_hashes = calculate_file_hashes(filepath, hash_algorithms, hash_cache, file_stat) if compute_hashes else {}
+    
+    # Extract metadata using a persistent ExifTool session
+    metadata_json, exiftool_errors = query_exiftool(exiftool_sessions, exiftool_path, ['-j', filepath])
+    if not metadata_json.strip():
+        raise ValueError(exiftool_errors or "ExifTool returned no metadata")
+    metadata = json.loads(metadata_json)[0]
+    
+    # Consolidate metadata, with one hash column per requested algorithm
+    consolidated_entry = {
+        'Nume fișier': os.path.basename(filepath),
+        'Cale completă': filepath,
+        'Dimensiune fișier': file_stat.st_size
+    }
+    for name in hash_algorithms:
+        # None marks a hash skipped for a unique-size file; '' marks a failed calculation
+        consolidated_entry[f"Hash {name.upper()}"] = (
+            file_hashes.get(f"{name.upper()}_Hash", '') if compute_hashes else None
+        )
+    consolidated_entry.update({
+        'Timestamp înregistrare': extraction_timestamp,
+        'Sursă/dispozitiv origine': device_source,
+        'Metadate suplimentare': metadata
+    })
+    return consolidated_entry
+
+def open_output_files(base_path, output_formats, fieldnames):
+    """
+    Open the consolidated output files so entries can be written as they are processed.
+    
+    :param base_path: Output path without extension
+    :param output_formats: Output formats to open ('json', 'jsonl', 'csv', 'txt')
+    :param fieldnames: Field names of the consolidated entries, used for the CSV header
+    :return: Dictionary mapping each opened format to its file, writer and entry count
+    """
+    outputs = {}
+    for output_format in ('json', 'jsonl', 'csv', 'txt'):
+        if output_format not in output_formats:
+            continue
+        try:
+            output_file = open(f"{base_path}.{output_format}", 'w', newline='' if output_format == 'csv' else None, encoding='utf-8')
+            output = {'file': output_file, 'entries': 0}
+            if output_format == 'json':
+                output_file.write('[\n')
+            elif output_format == 'csv':
+                output['writer'] = csv.DictWriter(output_file, fieldnames=fieldnames)
+                output['writer'].writeheader()
+            outputs[output_format] = output
+        except Exception as e:
+            logging.error(f"Error opening {output_format.upper()} output: {e}")
+    return outputs
+
+def mark_skipped_hashes(entry):
+    """
+    Replace skipped (None) hashes with SKIPPED_HASH_MARKER for the text-based outputs.
+    
+    :param entry: Consolidated or hash database entry
+    :return: Copy of the entry with SKIPPED_HASH_MARKER in place of None values
+    """
+    return {key: SKIPPED_HASH_MARKER if value is None else value for key, value in entry.items()}
+
+def write_output_entry(outputs, entry):
+    """
+    Append a consolidated entry to every open output file.
+    
+    :param outputs: Open outputs returned by open_output_files
+    :param entry: Consolidated metadata entry
+    """
+    for output_format, output in list(outputs.items()):
+        try:
+            output_file = output['file']
+            if output_format == 'json':
+                if output['entries']:
+                    output_file.write(',\n')
+                output_file.write(dumps_json(entry))
+            elif output_format == 'jsonl':
+                output_file.write(dumps_json(entry, indent=False))
+                output_file.write('\n')
+            elif output_format == 'csv':
+                output['writer'].writerow(mark_skipped_hashes(entry))
+            elif output_format == 'txt':
+                output_file.write(
+                    TXT_SEPARATOR
+                    + '\n'.join(f"{key}: {value}" for key, value in mark_skipped_hashes(entry).items())
+                    + '\n' + TXT_SEPARATOR + '\n'
+                )
+            output['entries'] += 1
+        except Exception as e:
+            logging.error(f"Error saving {output_format.upper()} output: {e}")
+            output['file'].close()
+            del outputs[output_format]
+
+def close_output_files(outputs):
+    """
+    Finish and close the consolidated output files, removing those left empty.
+    
+    :param outputs: Open outputs returned by open_output_files
+    """
+    for output_format, output in outputs.items():
+        output_file = output['file']
+        try:
+            if output_format == 'json':
+                output_file.write('\n]\n')
+            output_file.close()
+            if output['entries']:
+                logging.info(f"{output_format.upper()} output saved to {output_file.name}")
+            else:
+                os.remove(output_file.name)
+        except Exception as e:
+            logging.error(f"Error saving {output_format.upper()} output: {e}")
+
 def extract_metadata(folder_path, exiftool_path, output_options=None):
     """
     Extract and process metadata from files in a folder with progress tracking.
@@ -81,7 +534,7 @@ def extract_metadata(folder_path, exiftool_path, output_options=None):
     :param folder_path: Path to the folder containing files
     :param exiftool_path: Path to ExifTool executable
     :param output_options: Dictionary with output configuration
-    :return: List of consolidated metadata entries
+    :return: List of processed file names with their hash values
     """
     # Validate ExifTool path
     if not os.path.exists(exiftool_path):
@@ -91,8 +544,13 @@ def extract_metadata(folder_path, exiftool_path, output_options=None):
     # Default output options
     default_options = {
         'output_folder': os.path.join(folder_path, 'Forensic_metadata_output'),
-        'output_formats': ['json', 'csv', 'txt'],
-        'device_source': platform.node()
+        'output_formats': ['jsonl', 'csv', 'txt'],
+        'device_source': platform.node(),
+        'force_full_hash': False,
+        'hash_algorithms': ('sha256',),
+        # Off by default: a cached hash is trusted on path, size and mtime alone,
+        # which a forensic report should not do unless asked to
+        'use_hash_cache': False
     }
     
     # Merge default and user-provided options
@@ -101,97 +559,111 @@ def extract_metadata(folder_path, exiftool_path, output_options=None):
     # Ensure output folder exists
     prepare_output_folder(options['output_folder'])
 
-    # Get list of files and filter for files only
-    files = [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
+    # Get list of files in a single directory scan; DirEntry caches the stat result
+    with os.scandir(folder_path) as entries:
+        files = {entry.name: entry for entry in entries if entry.is_file()}
     
     logging.info(f"Starting metadata extraction for {len(files)} files")
 
-    # Process files and collect metadata with progress bar
-    consolidated_data = []
-    with tqdm(total=len(files), desc="Extracting Metadata", unit="file", 
-              bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
-        for filename in files:
-            filepath = os.path.join(folder_path, filename)
-            
-            try:
-                # Calculate file hashes
-                file_hashes = calculate_file_hashes(filepath)
-                
-                # Extract metadata using ExifTool
-                metadata_json = subprocess.check_output(
-                    [exiftool_path, '-j', filepath], 
-                    universal_newlines=True
-                )
-                metadata = json.loads(metadata_json)[0]
-                
-                # Consolidate metadata
-                consolidated_entry = {
-                    'Nume fișier': filename,
-                    'Cale completă': filepath,
-                    'Dimensiune fișier': os.path.getsize(filepath),
-                    'Hash MD5': file_hashes.get('MD5_Hash', ''),
-                    'Hash SHA1': file_hashes.get('SHA1_Hash', ''),
-                    'Hash SHA256': file_hashes.get('SHA256_Hash', ''),
-                    'Timestamp înregistrare': datetime.now().isoformat(),
-                    'Sursă/dispozitiv origine': options['device_source'],
-                    'Metadate suplimentare': metadata
-                }
-                
-                consolidated_data.append(consolidated_entry)
-                logging.info(f"Procesat: {filename}")
-                pbar.update(1)
-            
-            except Exception as e:
-                logging.error(f"Eroare la procesarea {filename}: {e}")
-                pbar.update(1)
+    # A file with a unique size cannot be a duplicate of another file, so only
+    # files sharing a size are hashed unless full hashing is forced
+    stats = {filename: entry.stat() for filename, entry in files.items()}
+    size_counts = Counter(file_stat.st_size for file_stat in stats.values())
+    hashed_files = {
+        filename for filename in files
+        if options['force_full_hash'] or size_counts[stats[filename].st_size] > 1
+    }
+    if len(hashed_files) < len(files):
+        logging.info(f"Skipping hashes for {len(files) - len(hashed_files)} files with a unique size")
+
+    # Hashes of unchanged files are reused from the previous run's hash database
+    hash_cache = None
+    if options['use_hash_cache']:
+        hash_cache = load_hash_cache(os.path.join(options['output_folder'], 'hash_database.db'))
 
-    # Output data in specified formats
+    # Entries are streamed to the output files as soon as each file is processed,
+    # keeping only the file names and hashes in memory for the hash database
     base_path = os.path.join(options['output_folder'], 'forensic_metadata_consolidated')
-    
-    if 'json' in options['output_formats'] and consolidated_data:
-        try:
-            with open(f"{base_path}.json", 'w', encoding='utf-8') as json_file:
-                json.dump(consolidated_data, json_file, indent=4, ensure_ascii=False)
-            logging.info(f"JSON output saved to {base_path}.json")
-        except Exception as e:
-            logging.error(f"Error saving JSON output: {e}")
-    
-    if 'csv' in options['output_formats'] and consolidated_data:
-        try:
-            with open(f"{base_path}.csv", 'w', newline='', encoding='utf-8') as csv_file:
-                fieldnames = list(consolidated_data[0].keys())
-                writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(consolidated_data)
-            logging.info(f"CSV output saved to {base_path}.csv")
-        except Exception as e:
-            logging.error(f"Error saving CSV output: {e}")
-    
-    if 'txt' in options['output_formats'] and consolidated_data:
-        try:
-            with open(f"{base_path}.txt", 'w', encoding='utf-8') as txt_file:
-                for entry in consolidated_data:
-                    txt_file.write("=" * 50 + "\n")
-                    for key, value in entry.items():
-                        txt_file.write(f"{key}: {value}\n")
-                    txt_file.write("=" * 50 + "\n\n")
-            logging.info(f"TXT output saved to {base_path}.txt")
-        except Exception as e:
-            logging.error(f"Error saving TXT output: {e}")
+    fieldnames = ['Nume fișier', 'Cale completă', 'Dimensiune fișier']
+    fieldnames += [f"Hash {name.upper()}" for name in options['hash_algorithms']]
+    fieldnames += ['Timestamp înregistrare', 'Sursă/dispozitiv origine', 'Metadate suplimentare']
+    outputs = {}
+    hash_entries = []
 
-        # Adaugă acest cod imediat după crearea celorlalte fișiere output
-    if consolidated_data:
-        create_hash_database(consolidated_data, options['output_folder'])
+    # One timestamp for the whole run, recorded in every entry
+    extraction_timestamp = datetime.now().isoformat()
 
-    logging.info(f"Metadata extraction completed. Total files processed: {len(consolidated_data)}")
-    return consolidated_data
+    # Process files in parallel, each worker thread borrowing an idle ExifTool session;
+    # results are written from this thread only, so the outputs need no locking.
+    # Sessions and outputs are opened inside the try, so a failed start still
+    # closes whatever was already opened
+    max_workers = max(1, min(os.cpu_count() or 1, len(files)))
+    exiftool_sessions = queue.Queue()
+    try:
+        for _ in range(max_workers):
+            exiftool_sessions.put(start_exiftool_session(exiftool_path))
+        outputs = open_output_files(base_path, options['output_formats'], fieldnames)
+        
+        with tqdm(total=len(files), desc="Extracting Metadata", unit="file", 
+                  bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Only a small window of files is in flight at a time, so completed entries
+            # do not pile up in their futures; results are taken oldest first, so the
+            # outputs list files in the same order on every run
+            file_items = iter(files.items())
+            pending = deque()
+            while True:
+                for filename, entry in islice(file_items, max_workers * 2 - len(pending)):
+                    pending.append((filename, executor.submit(
+                        process_file,
+                        entry.path,
+                        stats[filename],
+                        filename in hashed_files,
+                        options['hash_algorithms'],
+                        hash_cache,
+                        exiftool_sessions,
+                        exiftool_path,
+                        options['device_source'],
+                        extraction_timestamp
+                    )))
+                if not pending:
+                    break
+                
+                filename, future = pending.popleft()
+                try:
+                    consolidated_entry = future.result()
+                    write_output_entry(outputs, consolidated_entry)
+                    hash_entries.append({
+                        key: value for key, value in consolidated_entry.items()
+                        if key in ('Nume fișier', 'Dimensiune fișier') or key.startswith('Hash ')
+                    })
+                    logging.debug("Procesat: %s", filename)
+                except Exception as e:
+                    logging.error(f"Eroare la procesarea {filename}: {e}")
+                pbar.update(1)
+    finally:
+        close_output_files(outputs)
+        while not exiftool_sessions.empty():
+            close_exiftool_session(exiftool_sessions.get())
+        if hash_cache is not None:
+            save_hash_cache(hash_cache)
+
+    if hash_entries:
+        create_hash_database(hash_entries, options['output_folder'], options['hash_algorithms'])
+
+    logging.info(f"Metadata extraction completed. Total files processed: {len(hash_entries)}")
+    return hash_entries
 
-def create_hash_database(consolidated_data, output_folder):
+def create_hash_database(consolidated_data, output_folder, hash_algorithms=('sha256',)):
     """
-    Create a separate database file containing only filenames and their hash values.
+    Create a separate database file containing only filenames, sizes and their hash values.
     
-    :param consolidated_data: List of metadata entries
+    Hashes skipped for files with a unique size are stored as null (NULL in SQLite),
+    so the size column shows why they were not needed.
+    
+    :param consolidated_data: List of entries with the file name, size and 'Hash <ALGORITHM>' values
     :param output_folder: Folder where to save the hash database
+    :param hash_algorithms: hashlib algorithm names present in the entries
     :return: Path to the created database file
     """
     logging.info("Creating hash database file")
@@ -199,12 +671,9 @@ def create_hash_database(consolidated_data, output_folder):
     # Extract only the relevant fields
     hash_data = []
     for entry in consolidated_data:
-        hash_entry = {
-            'Nume fișier': entry['Nume fișier'],
-            'MD5': entry['Hash MD5'],
-            'SHA1': entry['Hash SHA1'],
-            'SHA256': entry['Hash SHA256']
-        }
+        hash_entry = {'Nume fișier': entry['Nume fișier'], 'Dimensiune fișier': entry['Dimensiune fișier']}
+        for name in hash_algorithms:
+            hash_entry[name.upper()] = entry[f"Hash {name.upper()}"]
         hash_data.append(hash_entry)
     
     # Create the hash database files
@@ -213,7 +682,7 @@ def create_hash_database(consolidated_data, output_folder):
     # Create JSON version
     try:
         with open(f"{hash_db_path}.json", 'w', encoding='utf-8') as json_file:
-            json.dump(hash_data, json_file, indent=4, ensure_ascii=False)
+            json_file.write(dumps_json(hash_data))
         logging.info(f"Hash database JSON saved to {hash_db_path}.json")
     except Exception as e:
         logging.error(f"Error saving hash database JSON: {e}")
@@ -224,43 +693,46 @@ def create_hash_database(consolidated_data, output_folder):
             fieldnames = list(hash_data[0].keys())
             writer = csv.DictWriter(csv_file, fieldnames=fieldnames)
             writer.writeheader()
-            writer.writerows(hash_data)
+            writer.writerows(mark_skipped_hashes(entry) for entry in hash_data)
         logging.info(f"Hash database CSV saved to {hash_db_path}.csv")
     except Exception as e:
         logging.error(f"Error saving hash database CSV: {e}")
     
     # Create SQLite database version
     try:
-        import sqlite3
         db_path = f"{hash_db_path}.db"
         conn = sqlite3.connect(db_path)
         cursor = conn.cursor()
         
-        # Create table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS file_hashes (
+        # Table with one column per hash algorithm
+        hash_columns = [name.lower() for name in hash_algorithms]
+        create_table_sql = '''
+            CREATE TABLE file_hashes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 filename TEXT NOT NULL,
-                md5 TEXT NOT NULL,
-                sha1 TEXT NOT NULL,
-                sha256 TEXT NOT NULL
-            )
-        ''')
+                size INTEGER NOT NULL
+        '''
+        for column in hash_columns:
+            create_table_sql += f',\n    {column} TEXT'
+        create_table_sql += '\n)'
         
-        # Insert data
-        for entry in hash_data:
-            cursor.execute('''
-                INSERT INTO file_hashes (filename, md5, sha1, sha256)
-                VALUES (?, ?, ?, ?)
-            ''', (
-                entry['Nume fișier'],
-                entry['MD5'],
-                entry['SHA1'],
-                entry['SHA256']
-            ))
+        insert_sql = (
+            f"INSERT INTO file_hashes (filename, size, {', '.join(hash_columns)}) "
+            f"VALUES ({', '.join('?' for _ in range(len(hash_columns) + 2))})"
+        )
+        rows = [
+            (entry['Nume fișier'], entry['Dimensiune fișier'], *(entry[name.upper()] for name in hash_algorithms))
+            for entry in hash_data
+        ]
         
-        conn.commit()
-        conn.close()
+        # Replace the table and insert all rows in one transaction
+        try:
+            with conn:
+                cursor.execute('DROP TABLE IF EXISTS file_hashes')
+                cursor.execute(create_table_sql)
+                cursor.executemany(insert_sql, rows)
+        finally:
+            conn.close()
         logging.info(f"Hash database SQLite saved to {db_path}")
     except Exception as e:
         logging.error(f"Error creating SQLite database: {e}")
@@ -281,6 +753,7 @@ def main():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     log_file = os.path.join('Jpg_folder\Forensic_metadata_output', 'forensic_metadata.log')
     setup_logging(log_file=log_file)
+    verify_crypto_acceleration()
 
     try:
         # Example configuration
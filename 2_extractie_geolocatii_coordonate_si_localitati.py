@@ -7,37 +7,320 @@ import sqlite3
 from datetime import datetime
 import platform
 import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
+# Read size used when hashing files; large reads let hashlib release the GIL
+HASH_CHUNK_SIZE = 1 << 20
 
-def calculate_file_hashes(filepath):
+# Seconds to wait for ExifTool to answer a command before replacing the session
+EXIFTOOL_TIMEOUT = 120
+
+# Tags produced by ExifTool's geolocation API, requested explicitly instead of -geolocation*
+GEOLOCATION_TAGS = [
+    'GeolocationCity',
+    'GeolocationRegion',
+    'GeolocationSubregion',
+    'GeolocationCountryCode',
+    'GeolocationCountry',
+    'GeolocationTimeZone',
+    'GeolocationFeatureCode',
+    'GeolocationFeatureType',
+    'GeolocationPopulation',
+    'GeolocationPosition',
+    'GeolocationDistance',
+    'GeolocationBearing'
+]
+
+
+
+def dumps_json(data):
     """
-    Calculate file hashes (MD5, SHA1, SHA256).
+    Serialize data to an indented JSON string, using orjson when it is installed.
+    
+    :param data: Data to serialize
+    :return: JSON string
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
+        except TypeError:
+            # orjson rejects some values (e.g. integers wider than 64 bits)
+            pass
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+def calculate_file_hashes(filepath, algorithms=('sha256',), hash_cache=None, file_stat=None):
+    """
+    Calculate file hashes (SHA256 by default).
     
     :param filepath: Path to the file
-    :return: Dictionary with file hashes
+    :param algorithms: hashlib algorithm names to calculate, e.g. ('md5', 'sha1', 'sha256')
+    :param hash_cache: Optional hash cache returned by load_hash_cache
+    :param file_stat: Optional os.stat_result of the file, saving a stat call for the cache lookup
+    :return: Dictionary with file hashes, keyed as '<ALGORITHM>_Hash'
     """
-    hash_algorithms = {
-        'MD5': hashlib.md5(),
-        'SHA1': hashlib.sha1(),
-        'SHA256': hashlib.sha256()
-    }
+    hash_keys = [f"{name.upper()}_Hash" for name in algorithms]
+    
+    # Reuse hashes from a previous run if the file is unchanged
+    if hash_cache is not None:
+        try:
+            stat = file_stat or os.stat(filepath)
+        except OSError as e:
+            logging.error(f"Error calculating hashes for {filepath}: {e}")
+            return {}
+        cache_key = (os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns)
+        hash_cache['scanned'][cache_key[0]] = cache_key
+        cached_hashes = hash_cache['entries'].get(cache_key, {})
+        if all(key in cached_hashes for key in hash_keys):
+            hash_cache['hits'][cache_key[0]] = True
+            return {key: cached_hashes[key] for key in hash_keys}
+    
+    hash_objects = [hashlib.new(name) for name in algorithms]
+    hash_updates = [hash_obj.update for hash_obj in hash_objects]
+    
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
     
     try:
-        with open(filepath, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                for hash_obj in hash_algorithms.values():
-                    hash_obj.update(chunk)
+        # Single pass over the file, feeding the same buffer to every digest
+        with open(filepath, 'rb', buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                chunk = view[:size]
+                for hash_update in hash_updates:
+                    hash_update(chunk)
         
-        return {
-            f"{alg}_Hash": hash_obj.hexdigest() 
-            for alg, hash_obj in hash_algorithms.items()
+        file_hashes = {
+            key: hash_obj.hexdigest()
+            for key, hash_obj in zip(hash_keys, hash_objects)
         }
+        if hash_cache is not None:
+            hash_cache['entries'][cache_key] = hash_cache['updated'][cache_key] = {**cached_hashes, **file_hashes}
+        return file_hashes
     except IOError as e:
         logging.error(f"Error calculating hashes for {filepath}: {e}")
         return {}
 
+def load_hash_cache(db_path):
+    """
+    Load previously calculated hashes from the SQLite hash cache.
+    
+    Entries are keyed by (absolute path, size, mtime_ns), so a file that has not
+    changed since the last run does not need to be read again.
+    
+    :param db_path: Path to the SQLite database holding the hash_cache table
+    :return: Dictionary with the loaded 'entries', plus the 'updated' entries, the
+             'scanned' keys and the cache 'hits' of this run
+    """
+    hash_cache = {'db_path': db_path, 'entries': {}, 'updated': {}, 'scanned': {}, 'hits': {}}
+    if not os.path.exists(db_path):
+        return hash_cache
+    
+    try:
+        conn = sqlite3.connect(db_path)
+        try:
+            cursor = conn.execute('''
+                SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'hash_cache'
+            ''')
+            if cursor.fetchone():
+                for path, size, mtime_ns, md5, sha1, sha256 in conn.execute(
+                    'SELECT path, size, mtime_ns, md5, sha1, sha256 FROM hash_cache'
+                ):
+                    hash_cache['entries'][(path, size, mtime_ns)] = {
+                        f"{alg}_Hash": value
+                        for alg, value in (('MD5', md5), ('SHA1', sha1), ('SHA256', sha256))
+                        if value
+                    }
+        finally:
+            conn.close()
+        logging.info(f"Loaded {len(hash_cache['entries'])} cached hashes from {db_path}")
+    except sqlite3.Error as e:
+        logging.warning(f"Could not load hash cache from {db_path}: {e}")
+    return hash_cache
+
+def save_hash_cache(hash_cache):
+    """
+    Persist the hashes calculated during this run to the SQLite hash cache.
+    
+    Rows for files looked up this run whose size or modification time has
+    changed since are deleted, so the table does not grow with stale entries.
+    
+    :param hash_cache: Hash cache returned by load_hash_cache
+    """
+    if hash_cache['hits']:
+        logging.info(f"Reused cached hashes for {len(hash_cache['hits'])} unchanged files (not recalculated)")
+    
+    stale_keys = [
+        key for key in hash_cache['entries']
+        if key[0] in hash_cache['scanned'] and key != hash_cache['scanned'][key[0]]
+    ]
+    if not hash_cache['updated'] and not stale_keys:
+        return
+    
+    try:
+        conn = sqlite3.connect(hash_cache['db_path'])
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                conn.execute('''
+                    CREATE TABLE IF NOT EXISTS hash_cache (
+                        path TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        md5 TEXT,
+                        sha1 TEXT,
+                        sha256 TEXT,
+                        PRIMARY KEY (path, size, mtime_ns)
+                    )
+                ''')
+                conn.executemany('''
+                    INSERT OR REPLACE INTO hash_cache (path, size, mtime_ns, md5, sha1, sha256)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [
+                    (path, size, mtime_ns,
+                     hashes.get('MD5_Hash'), hashes.get('SHA1_Hash'), hashes.get('SHA256_Hash'))
+                    for (path, size, mtime_ns), hashes in hash_cache['updated'].items()
+                ])
+                conn.executemany('''
+                    DELETE FROM hash_cache WHERE path = ? AND size = ? AND mtime_ns = ?
+                ''', stale_keys)
+        finally:
+            conn.close()
+        logging.info(
+            f"Saved {len(hash_cache['updated'])} hashes to cache {hash_cache['db_path']}, "
+            f"removed {len(stale_keys)} stale entries"
+        )
+    except sqlite3.Error as e:
+        logging.warning(f"Could not save hash cache to {hash_cache['db_path']}: {e}")
+
+def start_exiftool_session(exiftool_path):
+    """
+    Start a persistent ExifTool process in -stay_open mode.
+    
+    Reusing one process for all files avoids paying the Perl startup
+    cost for every file. Its stdout and stderr are read by background
+    threads, so a command that hangs can be given up on after a timeout.
+    
+    :param exiftool_path: Path to ExifTool executable
+    :return: Dictionary with the running ExifTool 'process' and the queues
+             receiving its 'stdout' and 'stderr' lines
+    """
+    process = subprocess.Popen(
+        [exiftool_path, '-stay_open', 'True', '-@', '-',
+         '-common_args', '-charset', 'filename=utf8'],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        encoding='utf-8',
+        bufsize=1
+    )
+    session = {'process': process, 'stdout': queue.Queue(), 'stderr': queue.Queue()}
+    for stream in ('stdout', 'stderr'):
+        threading.Thread(
+            target=read_pipe_lines,
+            args=(getattr(process, stream), session[stream]),
+            daemon=True
+        ).start()
+    return session
+
+def read_pipe_lines(pipe, lines):
+    """
+    Forward every line read from a pipe to a queue, followed by '' at end of file.
+    
+    :param pipe: Text pipe of the ExifTool process
+    :param lines: Queue receiving the lines
+    """
+    try:
+        for line in pipe:
+            lines.put(line)
+    except (OSError, ValueError):
+        pass
+    lines.put('')
+
+def run_exiftool_command(session, args):
+    """
+    Run a single command in a persistent ExifTool session.
+    
+    :param session: ExifTool session returned by start_exiftool_session
+    :param args: List of ExifTool arguments for this command
+    :return: Tuple of the command's output and its error messages
+    """
+    # -echo4 marks the end of this command's messages on stderr,
+    # the same way {ready} marks the end of its output on stdout
+    session['process'].stdin.write('\n'.join(args) + '\n-echo4\n{ready}\n-execute\n')
+    session['process'].stdin.flush()
+    
+    streams = []
+    for stream in ('stdout', 'stderr'):
+        lines = []
+        while True:
+            try:
+                line = session[stream].get(timeout=EXIFTOOL_TIMEOUT)
+            except queue.Empty:
+                raise RuntimeError(f"ExifTool did not respond within {EXIFTOOL_TIMEOUT} seconds")
+            if not line:
+                raise RuntimeError("ExifTool session terminated unexpectedly")
+            if line.rstrip() == '{ready}':
+                break
+            lines.append(line)
+        streams.append(''.join(lines))
+    return streams[0], streams[1].strip()
+
+def query_exiftool(exiftool_sessions, exiftool_path, args):
+    """
+    Run a command on an idle session from the pool.
+    
+    A session that died or did not respond within EXIFTOOL_TIMEOUT is killed and
+    its slot in the pool is left empty (None); the next command using that slot
+    starts a new session, so a single failure does not break every later file.
+    
+    :param exiftool_sessions: Queue of idle ExifTool sessions (None marks an empty slot)
+    :param exiftool_path: Path to ExifTool executable
+    :param args: List of ExifTool arguments for this command
+    :return: Tuple of the command's output and its error messages
+    """
+    session = exiftool_sessions.get()
+    try:
+        if session is None:
+            session = start_exiftool_session(exiftool_path)
+        return run_exiftool_command(session, args)
+    except (RuntimeError, OSError):
+        if session is not None:
+            session['process'].kill()
+            session['process'].wait()
+            session = None
+        raise
+    finally:
+        exiftool_sessions.put(session)
+
+def close_exiftool_session(session):
+    """
+    Ask a persistent ExifTool session to exit and wait for it.
+    
+    :param session: ExifTool session returned by start_exiftool_session, or None
+    """
+    if session is None:
+        return
+    process = session['process']
+    try:
+        process.stdin.write('-stay_open\nFalse\n')
+        process.stdin.flush()
+        process.stdin.close()
+        process.wait(timeout=10)
+    except Exception as e:
+        logging.warning(f"ExifTool session did not exit cleanly: {e}")
+        process.kill()
+
 def prepare_output_folder(output_path):
     """
     Prepare and return the output folder path.
@@ -53,6 +336,64 @@ def prepare_output_folder(output_path):
         logging.error(f"Error creating output folder {output_path}: {e}")
         raise
 
+def process_file(filepath, file_stat, hash_cache, exiftool_sessions, exiftool_path, device_source, extraction_timestamp):
+    """
+    Calculate the identification hash and extract geolocation data for a single file.
+    
+    :param filepath: Path to the file
+    :param file_stat: os.stat_result of the file
+    :param hash_cache: Hash cache returned by load_hash_cache, or None
+    :param exiftool_sessions: Queue of idle ExifTool sessions
+    :param exiftool_path: Path to ExifTool executable, used to replace a failed session
+    :param device_source: Source/device recorded in the entry
+    :param extraction_timestamp: ISO timestamp of the extraction run
+    :return: Geolocation entry, or None if no geolocation data was found
+    """
+    filename = os.path.basename(filepath)
+    
+    # Calculate file hashes for identification
+    file_hashes = calculate_file_hashes(filepath, algorithms=('md5',), hash_cache=hash_cache, file_stat=file_stat)
+    
+    # Extract geolocation data using a persistent ExifTool session
+    # -fast stops before JPEG trailers; -fast2 is not used, as it also stops reading
+    # QuickTime files at the media data and would lose GPS stored after it in MOV/MP4
+    geolocation_output, exiftool_errors = query_exiftool(
+        exiftool_sessions,
+        exiftool_path,
+        ['-fast', '-api', 'geolocation']
+        + [f'-{tag}' for tag in GEOLOCATION_TAGS]
+        + ['-j', '-q', '-q', filepath]
+    )
+    if not geolocation_output.strip():
+        logging.warning(f"ExifTool returned no data for {filename}: {exiftool_errors or 'no error reported'}")
+        return None
+    
+    try:
+        geo_data = json.loads(geolocation_output)
+        if geo_data and isinstance(geo_data, list) and len(geo_data) > 0:
+            geo_info = geo_data[0]
+            
+            # Create a consolidated entry with filename and geolocation data
+            consolidated_entry = {
+                'Filename': filename,
+                'Full Path': filepath,
+                'MD5_Hash': file_hashes.get('MD5_Hash', ''),
+                'Extraction Timestamp': extraction_timestamp,
+                'Source Device': device_source
+            }
+            
+            # Add the requested geolocation fields from ExifTool output
+            geo_info.pop('SourceFile', None)
+            consolidated_entry.update(geo_info)
+            
+            return consolidated_entry
+        
+        logging.warning(f"No geolocation data found for: {filename}")
+    except json.JSONDecodeError:
+        logging.warning(f"Failed to parse geolocation data for: {filename}")
+    
+    return None
+
 def extract_geolocation_data(folder_path, exiftool_path, output_options=None):
     """
     Extract geolocation metadata from files in a folder with progress tracking.
@@ -71,7 +412,9 @@ def extract_geolocation_data(folder_path, exiftool_path, output_options=None):
     default_options = {
         'output_folder': os.path.join(folder_path, 'Geolocation_data_output'),
         'output_formats': ['json', 'csv', 'sql'],
-        'device_source': platform.node()
+        'device_source': platform.node(),
+        # Off by default: a cached hash is trusted on path, size and mtime alone
+        'use_hash_cache': False
     }
     
     # Merge default and user-provided options
@@ -80,59 +423,65 @@ def extract_geolocation_data(folder_path, exiftool_path, output_options=None):
     # Ensure output folder exists
     prepare_output_folder(options['output_folder'])
 
-    # Get list of files and filter for files only
-    files = [f for f in os.listdir(folder_path) if os.path.isfile(os.path.join(folder_path, f))]
+    # Get list of files in a single directory scan; DirEntry caches the stat result
+    with os.scandir(folder_path) as entries:
+        files = {entry.name: entry for entry in entries if entry.is_file()}
     
     logging.info(f"Starting geolocation data extraction for {len(files)} files")
 
-    # Process files and collect geolocation data with progress bar
+    # Hashes of unchanged files are reused from the previous run's database
+    # The cache lives in the SQL output, so it is only used when that output is requested
+    hash_cache = None
+    if options['use_hash_cache'] and 'sql' in options['output_formats']:
+        hash_cache = load_hash_cache(os.path.join(options['output_folder'], 'geo_location.db'))
+    elif options['use_hash_cache']:
+        logging.warning("The hash cache is stored in the 'sql' output, which was not requested; hashes will not be cached")
+
+    # One timestamp for the whole run, recorded in every entry
+    extraction_timestamp = datetime.now().isoformat()
+
+    # Process files in parallel, each worker thread borrowing an idle ExifTool session;
+    # sessions are started inside the try, so a failed start still closes the others
     geolocation_data = []
-    with tqdm(total=len(files), desc="Extracting Geolocation Data", unit="file", 
-              bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar:
-        for filename in files:
-            filepath = os.path.join(folder_path, filename)
+    max_workers = max(1, min(os.cpu_count() or 1, len(files)))
+    exiftool_sessions = queue.Queue()
+    try:
+        for _ in range(max_workers):
+            exiftool_sessions.put(start_exiftool_session(exiftool_path))
+        
+        with tqdm(total=len(files), desc="Extracting Geolocation Data", unit="file", 
+                  bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]") as pbar, \
+                ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    process_file,
+                    entry.path,
+                    entry.stat(),
+                    hash_cache,
+                    exiftool_sessions,
+                    exiftool_path,
+                    options['device_source'],
+                    extraction_timestamp
+                ): filename
+                for filename, entry in files.items()
+            }
             
-            try:
-                # Calculate file hashes for identification
-                file_hashes = calculate_file_hashes(filepath)
-                
-                # Extract geolocation data using ExifTool with the geolocation API
-                geolocation_output = subprocess.check_output(
-                    [exiftool_path, '-api', 'geolocation', '-geolocation*', '-j', filepath], 
-                    universal_newlines=True
-                )
-                
+            # Results are taken in submission order, so the outputs list files in the
+            # same order on every run
+            for future, filename in futures.items():
                 try:
-                    geo_data = json.loads(geolocation_output)
-                    if geo_data and isinstance(geo_data, list) and len(geo_data) > 0:
-                        geo_info = geo_data[0]
-                        
-                        # Create a consolidated entry with filename and geolocation data
-                        consolidated_entry = {
-                            'Filename': filename,
-                            'Full Path': filepath,
-                            'MD5_Hash': file_hashes.get('MD5_Hash', ''),
-                            'Extraction Timestamp': datetime.now().isoformat(),
-                            'Source Device': options['device_source']
-                        }
-                        
-                        # Add all geolocation fields from ExifTool output
-                        for key, value in geo_info.items():
-                            if key.startswith('Geolocation'):
-                                consolidated_entry[key] = value
-                        
+                    consolidated_entry = future.result()
+                    if consolidated_entry is not None:
                         geolocation_data.append(consolidated_entry)
-                        logging.info(f"Processed: {filename}")
-                    else:
-                        logging.warning(f"No geolocation data found for: {filename}")
-                except json.JSONDecodeError:
-                    logging.warning(f"Failed to parse geolocation data for: {filename}")
-                
-                pbar.update(1)
-            
-            except Exception as e:
-                logging.error(f"Error processing {filename}: {e}")
+                        logging.debug("Processed: %s", filename)
+                except Exception as e:
+                    logging.error(f"Error processing {filename}: {e}")
                 pbar.update(1)
+    finally:
+        while not exiftool_sessions.empty():
+            close_exiftool_session(exiftool_sessions.get())
+        if hash_cache is not None:
+            save_hash_cache(hash_cache)
 
     # Output data in specified formats
     base_path = os.path.join(options['output_folder'], 'geo_location')
@@ -140,7 +489,7 @@ def extract_geolocation_data(folder_path, exiftool_path, output_options=None):
     if 'json' in options['output_formats'] and geolocation_data:
         try:
             with open(f"{base_path}.json", 'w', encoding='utf-8') as json_file:
-                json.dump(geolocation_data, json_file, indent=4, ensure_ascii=False)
+                json_file.write(dumps_json(geolocation_data))
             logging.info(f"JSON output saved to {base_path}.json")
         except Exception as e:
             logging.error(f"Error saving JSON output: {e}")
@@ -173,50 +522,36 @@ def extract_geolocation_data(folder_path, exiftool_path, output_options=None):
             for entry in geolocation_data:
                 geo_fields.update([k for k in entry.keys() if k.startswith('Geolocation')])
             
-            # Create table with dynamic columns based on available geolocation fields
-            create_table_sql = '''
-                CREATE TABLE IF NOT EXISTS geolocation_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    filename TEXT NOT NULL,
-                    full_path TEXT NOT NULL,
-                    md5_hash TEXT,
-                    extraction_timestamp TEXT,
-                    source_device TEXT
-            '''
-            
-            # Add geolocation fields to table schema
-            for field in sorted(geo_fields):
-                field_name = field.replace(' ', '_').lower()
-                create_table_sql += f',\n    {field_name} TEXT'
-            
-            create_table_sql += '\n)'
-            cursor.execute(create_table_sql)
+            # Map entry keys to column names and definitions once; the schema and
+            # the INSERT statement are both built from this single list
+            column_map = [
+                ('Filename', 'filename', 'TEXT NOT NULL'),
+                ('Full Path', 'full_path', 'TEXT NOT NULL'),
+                ('MD5_Hash', 'md5_hash', 'TEXT'),
+                ('Extraction Timestamp', 'extraction_timestamp', 'TEXT'),
+                ('Source Device', 'source_device', 'TEXT')
+            ]
+            # Add geolocation fields available in the entries
+            column_map += [(field, field.replace(' ', '_').lower(), 'TEXT') for field in sorted(geo_fields)]
+            entry_keys = [key for key, _, _ in column_map]
+            columns = [column for _, column, _ in column_map]
             
-            # Insert data
-            for entry in geolocation_data:
-                # Prepare column names and placeholders
-                columns = ['filename', 'full_path', 'md5_hash', 'extraction_timestamp', 'source_device']
-                values = [
-                    entry.get('Filename', ''),
-                    entry.get('Full Path', ''),
-                    entry.get('MD5_Hash', ''),
-                    entry.get('Extraction Timestamp', ''),
-                    entry.get('Source Device', '')
-                ]
-                
-                # Add geolocation fields
-                for field in sorted(geo_fields):
-                    field_name = field.replace(' ', '_').lower()
-                    columns.append(field_name)
-                    values.append(entry.get(field, ''))
-                
-                # Construct and execute SQL
-                placeholders = ', '.join(['?' for _ in columns])
-                insert_sql = f"INSERT INTO geolocation_data ({', '.join(columns)}) VALUES ({placeholders})"
-                cursor.execute(insert_sql, values)
+            # Create table with dynamic columns based on available geolocation fields
+            column_definitions = ['id INTEGER PRIMARY KEY AUTOINCREMENT']
+            column_definitions += [f"{column} {definition}" for _, column, definition in column_map]
+            create_table_sql = f"CREATE TABLE IF NOT EXISTS geolocation_data ({', '.join(column_definitions)})"
+            insert_sql = f"INSERT INTO geolocation_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
             
-            conn.commit()
-            conn.close()
+            # Create the table and insert all rows in one transaction
+            try:
+                with conn:
+                    cursor.execute(create_table_sql)
+                    cursor.executemany(insert_sql, (
+                        tuple(entry.get(key, '') for key in entry_keys)
+                        for entry in geolocation_data
+                    ))
+            finally:
+                conn.close()
             logging.info(f"SQLite database saved to {db_path}")
         except Exception as e:
             logging.error(f"Error creating SQLite database: {e}")
@@ -3,98 +3,160 @@ import folium
 import pandas as pd
 import os
 import shutil
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
-from PIL import Image
+from PIL import Image, features
 import html
 from folium.plugins import MarkerCluster
+from branca.element import MacroElement
+from jinja2 import Template
 
 # Crearea unui director static pentru a salva fișierele
 static_dir = "static"
 # Definește calea fișierului JSON
 json_file_path = r"Jpg_folder\Geolocation_data_output\geo_location.json"
 
+# Dimensiunea maximă a thumbnail-urilor
+thumbnail_size = (200, 200)
 
+# Șabloanele HTML ale popup-urilor, completate cu valori deja escapate
+popup_template = '<b>Filename:</b> {filename}<br><b>MD5:</b> {md5}<br><b>Location:</b> {city}, {country}<br>'
+thumbnail_template = '<img src="static/{thumbnail_filename}" alt="Thumbnail" style="width:100px;height:100px;"><br>'
+
+# Script Leaflet care creează toate marker-ele în browser și le adaugă în cluster
+# printr-un singur apel addLayers, în loc de câte un obiect folium.Marker pe punct
+marker_points_template = Template("""
+{% macro script(this, kwargs) %}
+    var {{ this.get_name() }} = {{ this.points_json }}.map(function (point) {
+        return L.marker([point.lat, point.lon], {
+            icon: L.AwesomeMarkers.icon({icon: "info-sign", markerColor: "blue", iconColor: "white", prefix: "glyphicon"})
+        }).bindPopup(point.popup, {maxWidth: 250});
+    });
+    {{ this._parent.get_name() }}.addLayers({{ this.get_name() }});
+{% endmacro %}
+""")
 
-if not os.path.exists(static_dir):
-    os.makedirs(static_dir)
 
 # Funcție pentru a crea un thumbnail
 def create_thumbnail(image_path, thumbnail_path):
     try:
-        img = Image.open(image_path)
-        img.thumbnail((200, 200))  # dimensiune thumbnail
-        img.save(thumbnail_path)
+        # Refolosește thumbnail-ul existent dacă nu e mai vechi decât imaginea sursă
+        if os.path.exists(thumbnail_path) and os.path.getmtime(thumbnail_path) >= os.path.getmtime(image_path):
+            return
+
+        with Image.open(image_path) as img:
+            # Pentru JPEG, decodează direct la o scară redusă în loc de rezoluția completă
+            img.draft('RGB', thumbnail_size)
+            img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+            img.save(thumbnail_path, optimize=True, quality=80)
     except Exception as e:
         print(f"❌ Eroare la crearea thumbnail-ului pentru {image_path}: {e}")
 
-# Încarcă datele din fișierul JSON
-with open(json_file_path, encoding="utf-8") as f:
-    data = json.load(f)
-
-df = pd.DataFrame(data)
-
-# Elimină rândurile fără coordonate
-df = df[df['GeolocationPosition'].notna()]
-df[['lat', 'lon']] = df['GeolocationPosition'].str.split(', ', expand=True)
-df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
-df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
-df = df.dropna(subset=["lat", "lon"])
-
-# Verifică dacă există date valide
-if df.empty:
-    print("❌ Eroare: Nicio coordonată validă găsită!")
-    exit()
-
-# Creare hartă centrată pe primul punct valid
-m = folium.Map(location=[df.iloc[0]["lat"], df.iloc[0]["lon"]], zoom_start=10)
-
-# Creează un cluster
-marker_cluster = MarkerCluster().add_to(m)
-
-# Listă pentru coordonatele markerelor
-coordinates = []
-
-# Adaugă marker-ele și salvează coordonatele pentru linie
-for _, row in tqdm(df.iterrows(), total=len(df), desc="Procesare imagini"):
-    popup_text = f"""
-        <b>Filename:</b> {html.escape(row['Filename'])}<br>
-        <b>MD5:</b> {row['MD5_Hash']}<br>
-        <b>Location:</b> {row.get('GeolocationCity', 'Unknown')}, {row.get('GeolocationCountry', 'Unknown')}<br>
-    """
-    
-    # Calea completă a imaginii
-    image_path = row['Full Path']
-    
-    # Verifică dacă imaginea există și are coordonate valide
-    if os.path.exists(image_path):
-        # Calea thumbnail-ului în directorul static
-        thumbnail_filename = f"thumb_{os.path.basename(image_path)}"
-        thumbnail_path = os.path.join(static_dir, thumbnail_filename)
-        
-        # Crează thumbnail-ul
-        create_thumbnail(image_path, thumbnail_path)
-        
-        # Adăugăm thumbnail-ul la popup
-        popup_text += f'<img src="static/{thumbnail_filename}" alt="Thumbnail" style="width:100px;height:100px;"><br>'
-    
-    # Adaugă marker-ul la hartă
-    folium.Marker(
-        location=[row["lat"], row["lon"]],
-        popup=folium.Popup(popup_text, max_width=250),
-        icon=folium.Icon(color="blue", icon="info-sign")
-    ).add_to(marker_cluster)
-    
-    # Colectăm coordonatele pentru PolyLine
-    coordinates.append((row["lat"], row["lon"]))
-
-# Adaugă linia (PolyLine) între toate marker-ele
-folium.PolyLine(
-    coordinates, 
-    color="blue", 
-    weight=2.5, 
-    opacity=0.8
-).add_to(m)
-
-# Salvează harta și anunță utilizatorul
-m.save("harta_exif_clusterizata_thumbnail_linii_.html")
-print("✅ Harta cu MarkerCluster, linii și imagini (thumbnails) a fost generată: harta_exif_clusterizata_si_linii.html")
+# Variantă cu un singur argument, pentru ProcessPoolExecutor.map
+def create_thumbnail_job(job):
+    create_thumbnail(*job)
+
+# Adaugă toate punctele în cluster ca un singur array JSON
+def add_markers_to_cluster(marker_cluster, points):
+    markers = MacroElement()
+    markers._template = marker_points_template
+    # Evită închiderea prematură a tag-ului <script> din popup-uri
+    markers.points_json = json.dumps(points).replace('</', '<\\/')
+    marker_cluster.add_child(markers)
+
+# Coloană de locație escapată pentru popup, sau 'Unknown' dacă lipsește
+def location_column(df, column):
+    if column in df.columns:
+        return df[column].fillna('Unknown').astype(str).map(html.escape)
+    return 'Unknown'
+
+def main():
+    if not os.path.exists(static_dir):
+        os.makedirs(static_dir)
+
+    # Decodarea și codarea JPEG pentru thumbnail-uri e mult mai rapidă cu libjpeg-turbo
+    if not features.check_feature('libjpeg_turbo'):
+        print("⚠️ Pillow nu folosește libjpeg-turbo; crearea thumbnail-urilor va fi mai lentă.")
+
+    # Încarcă datele din fișierul JSON
+    with open(json_file_path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    df = pd.DataFrame(data)
+
+    # Extrage latitudinea și longitudinea printr-o singură expresie regulată
+    # și elimină rândurile fără coordonate valide
+    coords = (
+        df['GeolocationPosition'].dropna().astype(str)
+        .str.extract(r'^\s*(-?\d+(?:\.\d*)?),\s*(-?\d+(?:\.\d*)?)\s*$')
+        .astype('float64')
+        .dropna()
+    )
+    df = df.loc[coords.index].assign(lat=coords[0], lon=coords[1])
+
+    # Verifică dacă există date valide
+    if df.empty:
+        print("❌ Eroare: Nicio coordonată validă găsită!")
+        return
+
+    # Creare hartă centrată pe primul punct valid
+    m = folium.Map(location=[df.iloc[0]["lat"], df.iloc[0]["lon"]], zoom_start=10)
+
+    # Creează un cluster
+    marker_cluster = MarkerCluster().add_to(m)
+
+    # Construiește textul popup-urilor pentru toate rândurile deodată, fără iterrows
+    popup_fields = pd.DataFrame({
+        'filename': df['Filename'].astype(str).map(html.escape),
+        'md5': df['MD5_Hash'].astype(str).map(html.escape),
+        'city': location_column(df, 'GeolocationCity'),
+        'country': location_column(df, 'GeolocationCountry')
+    }, index=df.index)
+    df['popup'] = [popup_template.format_map(fields) for fields in popup_fields.to_dict('records')]
+
+    # Coordonatele markerelor pentru linie, extrase dintr-o singură operație
+    coordinates = df[['lat', 'lon']].to_numpy().tolist()
+
+    # Calea thumbnail-ului în directorul static, pentru fiecare imagine existentă
+    thumbnail_jobs = {}
+    for image_path in df['Full Path'].to_numpy():
+        if image_path not in thumbnail_jobs and os.path.exists(image_path):
+            thumbnail_jobs[image_path] = os.path.join(static_dir, f"thumb_{os.path.basename(image_path)}")
+
+    # Crează thumbnail-urile în paralel, decodarea imaginilor fiind limitată de CPU
+    with ProcessPoolExecutor() as executor:
+        list(tqdm(
+            executor.map(create_thumbnail_job, thumbnail_jobs.items()),
+            total=len(thumbnail_jobs),
+            desc="Creare thumbnail-uri"
+        ))
+
+    # Construiește punctele markerelor, iterând direct peste coloanele ca tupluri simple
+    points = []
+    rows = zip(df['lat'].to_numpy(), df['lon'].to_numpy(), df['popup'].to_numpy(), df['Full Path'].to_numpy())
+    for lat, lon, popup_text, image_path in rows:
+        # Adăugăm thumbnail-ul la popup dacă imaginea există
+        if image_path in thumbnail_jobs:
+            thumbnail_filename = os.path.basename(thumbnail_jobs[image_path])
+            popup_text += thumbnail_template.format(thumbnail_filename=thumbnail_filename)
+
+        points.append({'lat': float(lat), 'lon': float(lon), 'popup': popup_text})
+
+    # Adaugă marker-ele la hartă
+    add_markers_to_cluster(marker_cluster, points)
+
+    # Adaugă linia (PolyLine) între toate marker-ele
+    folium.PolyLine(
+        coordinates,
+        color="blue",
+        weight=2.5,
+        opacity=0.8
+    ).add_to(m)
+
+    # Salvează harta și anunță utilizatorul
+    m.save("harta_exif_clusterizata_thumbnail_linii_.html")
+    print("✅ Harta cu MarkerCluster, linii și imagini (thumbnails) a fost generată: harta_exif_clusterizata_si_linii.html")
+
+# Protecția __main__ e necesară pentru ProcessPoolExecutor pe Windows (spawn)
+if __name__ == "__main__":
+    main()